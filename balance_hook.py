@@ -14,11 +14,12 @@ Exit codes: 0 = allow, 2 = block (stderr shown to user)
 
 import json
 import sys
-from pathlib import Path
 
 from balance_utils import (
+    EXTEND_CMD,
     check_override,
-    count_extensions_today,
+    extension_counts_today,
+    extension_menu_lines,
     find_schedule,
     fmt_minutes,
     get_windows,
@@ -38,23 +39,25 @@ from balance_utils import (
 # Extension menu (shown on block)
 # ═══════════════════════════════════════════════════════════════════
 
-EXTEND_CMD = str(Path(__file__).parent / "balance-extend")
-
-
 def extension_menu(config, now, context):
     """Build a block message with available extension options."""
     extensions = config.get("extensions", {})
+    menu_lines = config.get("_ext_menu_lines") or {}
+    counts = extension_counts_today(now)
     lines = []
     available = []
     for ext_type, ext in extensions.items():
-        used = count_extensions_today(now, ext_type)
+        used = counts.get(ext_type, 0)
         max_d = ext["max_per_day"]
         remaining = max_d - used
+        # load_config precomputes these; build any type it didn't see
+        prefix, none_left = (menu_lines.get(ext_type)
+                             or extension_menu_lines({ext_type: ext})[ext_type])
         if remaining > 0:
-            lines.append(f"  {EXTEND_CMD} {ext_type:<8} \u2014 {ext['label']} ({remaining} remaining)")
+            lines.append(f"{prefix} ({remaining} remaining)")
             available.append(ext_type)
         else:
-            lines.append(f"  {EXTEND_CMD} {ext_type:<8} \u2014 {ext['label']} (none left)")
+            lines.append(none_left)
 
     if available:
         lines.append(f"  {EXTEND_CMD}          \u2014 interactive chooser")
@@ -69,68 +72,86 @@ def extension_menu(config, now, context):
 # Core enforcement
 # ═══════════════════════════════════════════════════════════════════
 
-def check_window(config, now):
-    """Check time-of-day window. Returns (in_window, sched_name, sched, active_end_m, block_msg)."""
+def check_window(config, now, cur_m):
+    """Check time-of-day window. Returns (in_window, sched_name, sched, active_end_m, block_msg).
+
+    block_msg is a zero-arg callable that builds the block message, or None
+    when inside a window — the message is only formatted if it is shown.
+    """
     iso_day = now.isoweekday()
     sched_name, sched = find_schedule(config, iso_day)
 
     if sched is None:
-        na = next_available(config, now)
-        msg = extension_menu(config, now, f"Claude Code is offline today. Next available: {na}.")
+        def msg():
+            na = next_available(config, now, cur_m)
+            return extension_menu(config, now, f"Claude Code is offline today. Next available: {na}.")
         return False, None, None, None, msg
 
     windows = get_windows(sched)
-    cur_m = now.hour * 60 + now.minute
     inside, _, end_m = in_any_window(windows, cur_m)
 
     if not inside:
-        na = next_available(config, now)
-        summary = windows_summary(windows)
-        msg = extension_menu(
-            config, now,
-            f"Outside allowed hours ({summary}). Next window: {na}."
-        )
+        def msg():
+            na = next_available(config, now, cur_m)
+            summary = windows_summary(windows)
+            return extension_menu(
+                config, now,
+                f"Outside allowed hours ({summary}). Next window: {na}."
+            )
         return False, sched_name, sched, None, msg
 
-    return True, sched_name, sched, end_m, ""
+    return True, sched_name, sched, end_m, None
 
 
 def check_daily_cap(config, sched, now):
-    """Check daily usage cap. Returns (under_cap, used_min, limit_min, block_msg)."""
+    """Check daily usage cap. Returns (under_cap, used_min, limit_min, block_msg).
+
+    block_msg is a zero-arg callable as in check_window, or None when under the cap.
+    """
     limit = sched.get("daily_limit_minutes")
     if limit is None:
-        return True, 0, None, ""
+        return True, 0, None, None
 
-    used = get_active_minutes(now)
+    used = get_active_minutes(now, limit)
 
     if used >= limit:
-        msg = extension_menu(
-            config, now,
-            f"Daily limit reached ({used}/{limit} minutes used today)."
-        )
+        def msg():
+            return extension_menu(
+                config, now,
+                f"Daily limit reached ({used}/{limit} minutes used today)."
+            )
         return False, used, limit, msg
 
-    return True, used, limit, ""
+    return True, used, limit, None
 
 
-def build_warnings(config, now, active_end_m, used_minutes, limit_minutes):
-    """Build context warnings for approaching limits."""
+def build_warnings(config, cur_m, active_end_m, used_minutes, limit_minutes):
+    """Build context warnings for approaching limits.
+
+    Thresholds come from the "_warn_end"/"_warn_cap" keys load_config adds,
+    falling back to the raw settings for configs built by hand.
+    """
     warnings = []
-    cur_m = now.hour * 60 + now.minute
 
     # Window ending soon
     if active_end_m is not None:
         window_remaining = active_end_m - cur_m
-        warn_window = config.get("warning_minutes_before_end", 15)
-        if 0 < window_remaining <= warn_window:
-            warnings.append(f"Window closes in {window_remaining} minutes.")
+        if window_remaining > 0:
+            warn_window = config.get("_warn_end")
+            if warn_window is None:
+                warn_window = config.get("warning_minutes_before_end", 15)
+            if window_remaining <= warn_window:
+                warnings.append(f"Window closes in {window_remaining} minutes.")
 
     # Daily cap approaching
     if limit_minutes is not None:
         remaining = limit_minutes - used_minutes
-        warn_cap = config.get("warning_minutes_before_cap", 30)
-        if 0 < remaining <= warn_cap:
-            warnings.append(f"Daily usage: {used_minutes}/{limit_minutes} min ({remaining} min remaining).")
+        if remaining > 0:
+            warn_cap = config.get("_warn_cap")
+            if warn_cap is None:
+                warn_cap = config.get("warning_minutes_before_cap", 30)
+            if remaining <= warn_cap:
+                warnings.append(f"Daily usage: {used_minutes}/{limit_minutes} min ({remaining} min remaining).")
 
     return warnings
 
@@ -139,6 +160,13 @@ def build_warnings(config, now, active_end_m, used_minutes, limit_minutes):
 # Main
 # ═══════════════════════════════════════════════════════════════════
 
+def _ctx(msg):
+    """Serialize the {"additionalContext": msg} hook payload."""
+    if msg.isascii() and msg.isprintable() and '"' not in msg and "\\" not in msg:
+        return f'{{"additionalContext": "{msg}"}}'
+    return '{"additionalContext": ' + json.dumps(msg) + "}"
+
+
 def main():
     try:
         config = load_config()
@@ -147,6 +175,7 @@ def main():
             sys.exit(0)
 
         now = get_now(config.get("timezone", "Europe/London"))
+        cur_m = now.hour * 60 + now.minute
 
         # Periodic cleanup (once per day, tracked by marker file)
         maybe_cleanup(now)
@@ -155,27 +184,27 @@ def main():
         override_active, override_info = check_override(config, now)
         if override_active:
             record_prompt(now)
-            print(json.dumps({"additionalContext": f"Time override active: {override_info}"}))
+            print(_ctx(f"Time override active: {override_info}"))
             sys.stdout.flush()
             sys.exit(0)
 
         # ── Window check ──
-        in_window, sched_name, sched, active_end_m, window_msg = check_window(config, now)
+        in_window, sched_name, sched, active_end_m, window_msg = check_window(config, now, cur_m)
         if not in_window:
-            print(window_msg, file=sys.stderr)
+            print(window_msg(), file=sys.stderr)
             sys.exit(2)
 
         # ── Daily cap check ──
         cap_ok, used, limit, cap_msg = check_daily_cap(config, sched, now)
         if not cap_ok:
-            print(cap_msg, file=sys.stderr)
+            print(cap_msg(), file=sys.stderr)
             sys.exit(2)
 
         # ── Allowed — record usage and check for warnings ──
         record_prompt(now)
-        warnings = build_warnings(config, now, active_end_m, used, limit)
+        warnings = build_warnings(config, cur_m, active_end_m, used, limit)
         if warnings:
-            print(json.dumps({"additionalContext": " | ".join(warnings)}))
+            print(_ctx(" | ".join(warnings)))
             sys.stdout.flush()
 
         sys.exit(0)
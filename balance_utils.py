@@ -7,14 +7,28 @@ Used by both balance_hook.py (the hook) and balance-extend (the CLI).
 import fcntl
 import json
 import os
+import pickle
 import time
+from bisect import bisect_right
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 
+try:
+    import orjson  # optional: faster parsing straight from bytes
+except ImportError:
+    orjson = None
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9: get_now falls back to the TZ env var
+    ZoneInfo = None
+
 # ── Paths ──
 HOOKS_DIR = Path(__file__).parent
 CONFIG_PATH = HOOKS_DIR / "balance.json"
 USAGE_DIR = HOOKS_DIR / ".usage"
+EXTEND_CMD = str(HOOKS_DIR / "balance-extend")
 
 # ── Defaults ──
 DEFAULT_CONFIG = {
@@ -41,47 +55,166 @@ DEFAULT_CONFIG = {
 # Config
 # ═══════════════════════════════════════════════════════════════════
 
-def load_config():
-    if CONFIG_PATH.exists():
+def _read_json(path):
+    """Parse a JSON file, with orjson when installed.
+
+    orjson's decode error subclasses json.JSONDecodeError, so callers catch
+    the same exceptions either way.
+    """
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text())
+
+
+_CONFIG_CACHE = None  # (key, cfg) for the last config loaded in this process
+
+
+_NO_SCHEDULE = (None, None)
+
+
+def _build_day_index(schedule):
+    """Map ISO weekday (list index 1-7) to (name, sched); first block wins.
+
+    Unscheduled days map to (None, None), so lookups need no fallback.
+    """
+    index = [_NO_SCHEDULE] * 8
+    for name, sched in schedule.items():
+        for d in sched.get("days", []):
+            if isinstance(d, int) and 1 <= d <= 7 and index[d] is _NO_SCHEDULE:
+                index[d] = (name, sched)
+    return index
+
+
+def extension_menu_lines(extensions):
+    """Pre-format the block-message line for each extension type.
+
+    Returns {ext_type: (available_prefix, none_left_line)}; the caller appends
+    " (N remaining)" to the prefix.
+    """
+    lines = {}
+    for ext_type, ext in extensions.items():
+        prefix = f"  {EXTEND_CMD} {ext_type:<8} \u2014 {ext.get('label', ext_type)}"
+        lines[ext_type] = (prefix, f"{prefix} (none left)")
+    return lines
+
+
+def _add_derived(cfg):
+    """Attach the lookups the hook reads on every prompt (keys start with '_')."""
+    cfg["_day_index"] = _build_day_index(cfg["schedule"])
+    cfg["_ext_menu_lines"] = extension_menu_lines(cfg["extensions"])
+    cfg["_warn_end"] = cfg["warning_minutes_before_end"]
+    cfg["_warn_cap"] = cfg["warning_minutes_before_cap"]
+    return cfg
+
+
+def _default_config():
+    return _add_derived(DEFAULT_CONFIG.copy())
+
+
+def _merge_config(uc):
+    cfg = {**DEFAULT_CONFIG, **uc}
+    cfg["schedule"] = uc.get("schedule", DEFAULT_CONFIG["schedule"])
+    cfg["extensions"] = {**DEFAULT_CONFIG["extensions"], **uc.get("extensions", {})}
+    cfg["override"] = {**DEFAULT_CONFIG["override"], **uc.get("override", {})}
+    return _add_derived(cfg)
+
+
+def _read_config_pickle(cache_path, key):
+    """Return the parsed user config from the pickle sidecar if its key matches."""
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, uc = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        return None
+    if type(cached_key) is not tuple or cached_key != key or type(uc) is not dict:
+        return None
+    return uc
+
+
+def _write_config_pickle(cache_path, key, uc):
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, uc), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PicklingError):
         try:
-            with open(CONFIG_PATH) as f:
-                uc = json.load(f)
-            cfg = {**DEFAULT_CONFIG, **uc}
-            cfg["schedule"] = uc.get("schedule", DEFAULT_CONFIG["schedule"])
-            cfg["extensions"] = {**DEFAULT_CONFIG["extensions"], **uc.get("extensions", {})}
-            cfg["override"] = {**DEFAULT_CONFIG["override"], **uc.get("override", {})}
-            return cfg
-        except (json.JSONDecodeError, KeyError, OSError):
+            tmp_path.unlink()
+        except OSError:
             pass
-    return DEFAULT_CONFIG.copy()
+
+
+def load_config():
+    """Load balance.json merged over the defaults.
+
+    The merged config is cached in-process keyed by (path, mtime, size), and
+    the parsed JSON is mirrored to a pickle sidecar so a fresh hook process can
+    skip decoding while the file is unchanged. Loading a changed file drops the
+    get_windows cache. Treat the result as read-only.
+    """
+    global _CONFIG_CACHE
+    try:
+        st = CONFIG_PATH.stat()
+    except OSError:
+        return _default_config()
+
+    key = (str(CONFIG_PATH), st.st_mtime_ns, st.st_size)
+    if _CONFIG_CACHE is not None and _CONFIG_CACHE[0] == key:
+        return _CONFIG_CACHE[1]
+
+    cache_path = CONFIG_PATH.with_suffix(".cache.pickle")
+    uc = _read_config_pickle(cache_path, key)
+    from_json = uc is None
+    try:
+        if from_json:
+            uc = _read_json(CONFIG_PATH)
+        cfg = _merge_config(uc)
+    except (json.JSONDecodeError, KeyError, OSError):
+        return _default_config()
+
+    if from_json:
+        _write_config_pickle(cache_path, key, uc)
+    clear_windows_cache()  # windows parsed from the replaced config's schedules
+    _CONFIG_CACHE = (key, cfg)
+    return cfg
 
 
 # ═══════════════════════════════════════════════════════════════════
 # Time helpers
 # ═══════════════════════════════════════════════════════════════════
 
-def get_now(timezone_name):
-    try:
-        from zoneinfo import ZoneInfo
-        return datetime.now(ZoneInfo(timezone_name))
-    except (ImportError, KeyError):
-        try:
-            old_tz = os.environ.get("TZ")
-            os.environ["TZ"] = timezone_name
-            time.tzset()
-            now = datetime.now()
-            if old_tz is None:
-                del os.environ["TZ"]
-            else:
-                os.environ["TZ"] = old_tz
-            time.tzset()
-            return now
-        except Exception:
-            return datetime.now()
+@lru_cache(maxsize=4)
+def _tz(timezone_name):
+    return ZoneInfo(timezone_name)
 
 
-def parse_time(t):
-    """Parse 'HH:MM' to minutes since midnight. Raises ValueError on bad input."""
+def get_now(timezone_name):
+    if ZoneInfo is not None:
+        try:
+            return datetime.now(_tz(timezone_name))
+        except KeyError:  # ZoneInfoNotFoundError: unknown zone name
+            pass
+    try:
+        old_tz = os.environ.get("TZ")
+        os.environ["TZ"] = timezone_name
+        time.tzset()
+        now = datetime.now()
+        if old_tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = old_tz
+        time.tzset()
+        return now
+    except Exception:
+        return datetime.now()
+
+
+_MIN_TO_HHMM = tuple(f"{m // 60:02d}:{m % 60:02d}" for m in range(1441))  # includes 24:00
+_HHMM_TO_MIN = {s: m for m, s in enumerate(_MIN_TO_HHMM[:1440])}
+_HHMM_TO_MIN.update({s[1:]: m for m, s in enumerate(_MIN_TO_HHMM[:600])})  # "8:30" too
+
+
+def _slow_parse_time(t):
     try:
         parts = t.split(":")
         if len(parts) != 2:
@@ -94,77 +227,138 @@ def parse_time(t):
         raise ValueError(f"Invalid time {t!r}: {e}") from e
 
 
+def parse_time(t):
+    """Parse 'HH:MM' to minutes since midnight. Raises ValueError on bad input."""
+    try:
+        return _HHMM_TO_MIN[t]
+    except (KeyError, TypeError):
+        # Non-canonical (" 08:30") or invalid input
+        return _slow_parse_time(t)
+
+
 def fmt_minutes(m):
     """Format minutes since midnight as HH:MM."""
+    if 0 <= m <= 1440:
+        return _MIN_TO_HHMM[m]
     return f"{m // 60:02d}:{m % 60:02d}"
 
 
+def _date_str(dt):
+    """Format as YYYY-MM-DD, the per-day usage file prefix."""
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}"
+
+
+_WINDOWS_CACHE = {}  # id(sched) -> (sched, windows); holding sched keeps the id unique
+
+
+_BOUNDS_CACHE = {}  # id(windows) -> (windows, starts, ends), same scheme as above
+
+
+def clear_windows_cache():
+    _WINDOWS_CACHE.clear()
+    _BOUNDS_CACHE.clear()
+
+
 def get_windows(sched):
     """Extract time windows from a schedule block.
 
     Supports two formats:
       New: {"windows": [{"start": "08:00", "end": "18:00"}, ...]}
       Legacy: {"start_hour": 8, "end_hour": 18, ...}
-    Returns list of (start_minutes, end_minutes) tuples.
+    Returns list of (start_minutes, end_minutes) tuples. Results are memoized
+    per schedule dict, so treat both the dict and the list as read-only.
     """
+    hit = _WINDOWS_CACHE.get(id(sched))
+    if hit is not None and hit[0] is sched:
+        return hit[1]
+
     if "windows" in sched:
-        return [(parse_time(w["start"]), parse_time(w["end"])) for w in sched["windows"]]
+        windows = [(parse_time(w["start"]), parse_time(w["end"])) for w in sched["windows"]]
+    else:
+        # Legacy single-window format
+        start = sched.get("start_hour", 0) * 60 + sched.get("start_minute", 0)
+        end = sched.get("end_hour", 24) * 60 + sched.get("end_minute", 0)
+        windows = [(start, end)]
 
-    # Legacy single-window format
-    start = sched.get("start_hour", 0) * 60 + sched.get("start_minute", 0)
-    end = sched.get("end_hour", 24) * 60 + sched.get("end_minute", 0)
-    return [(start, end)]
+    _WINDOWS_CACHE[id(sched)] = (sched, windows)
+    return windows
 
 
 def find_schedule(config, iso_weekday):
     """Find the schedule block covering this ISO weekday (1=Mon, 7=Sun)."""
+    index = config.get("_day_index")
+    if index is not None:
+        return index[iso_weekday]
     for name, sched in config["schedule"].items():
         if iso_weekday in sched.get("days", []):
             return name, sched
     return None, None
 
 
+def _window_bounds(windows):
+    """Sorted, non-overlapping (starts, ends) tuples for bisecting `windows`."""
+    hit = _BOUNDS_CACHE.get(id(windows))
+    if hit is not None and hit[0] is windows:
+        return hit
+    starts, ends = [], []
+    for start_m, end_m in sorted(windows):
+        if start_m >= end_m:
+            continue  # empty window never matches
+        if ends and start_m < ends[-1]:
+            ends[-1] = max(ends[-1], end_m)
+        else:
+            starts.append(start_m)
+            ends.append(end_m)
+    hit = _BOUNDS_CACHE[id(windows)] = (windows, tuple(starts), tuple(ends))
+    return hit
+
+
 def in_any_window(windows, cur_m):
     """Check if current time (minutes) is inside any window.
 
     Returns (inside, window_start, window_end) where start/end are the
-    matching window bounds, or (False, None, None).
+    matching window bounds, or (False, None, None). Overlapping windows are
+    treated as one, so the bounds are those of the merged span.
     """
-    for start_m, end_m in windows:
-        if start_m <= cur_m < end_m:
-            return True, start_m, end_m
+    _, starts, ends = _window_bounds(windows)
+    i = bisect_right(starts, cur_m) - 1
+    if i >= 0 and cur_m < ends[i]:
+        return True, starts[i], ends[i]
     return False, None, None
 
 
 def next_window_today(windows, cur_m):
     """Find the next window that starts after current time today."""
-    upcoming = [(s, e) for s, e in windows if s > cur_m]
-    if upcoming:
-        upcoming.sort()
-        return upcoming[0]
-    return None
+    _, starts, ends = _window_bounds(windows)
+    i = bisect_right(starts, cur_m)
+    return (starts[i], ends[i]) if i < len(starts) else None
 
 
-def next_available(config, now):
-    """Find the next time Claude Code will be available."""
-    cur_m = now.hour * 60 + now.minute
+_DAY_NAMES = (None, "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def next_available(config, now, cur_m):
+    """Find the next time Claude Code will be available.
+
+    `cur_m` is `now` as minutes since midnight, computed once by the caller.
+    """
+    iso = now.isoweekday()
 
     # Check later today
-    _, today_sched = find_schedule(config, now.isoweekday())
+    _, today_sched = find_schedule(config, iso)
     if today_sched:
         nw = next_window_today(get_windows(today_sched), cur_m)
         if nw:
             return f"today at {fmt_minutes(nw[0])}"
 
-    # Check upcoming days
+    # Check upcoming days: ISO weekday arithmetic, no date objects
     for offset in range(1, 8):
-        future = now + timedelta(days=offset)
-        _, sched = find_schedule(config, future.isoweekday())
+        day = (iso + offset - 1) % 7 + 1
+        _, sched = find_schedule(config, day)
         if sched:
-            windows = get_windows(sched)
-            if windows:
-                earliest = min(w[0] for w in windows)
-                return f"{future.strftime('%A')} at {fmt_minutes(earliest)}"
+            starts = _window_bounds(get_windows(sched))[1]
+            if starts:
+                return f"{_DAY_NAMES[day]} at {fmt_minutes(starts[0])}"
     return "unknown"
 
 
@@ -175,148 +369,315 @@ def windows_summary(windows):
 
 
 # ═══════════════════════════════════════════════════════════════════
-# Usage tracking — one file per day, one timestamp per prompt
+# Usage tracking — one 1440-bit bitmap per day, bit N = minute N of the day
 # Active minutes = count of distinct clock-minutes with >= 1 prompt
 # ═══════════════════════════════════════════════════════════════════
 
+USAGE_BITMAP_BYTES = 180  # 24 * 60 bits
+
+
 def usage_file_for(date_str):
+    """Path (as str) of the day's usage bitmap; creates USAGE_DIR if needed."""
     USAGE_DIR.mkdir(parents=True, exist_ok=True)
-    return USAGE_DIR / f"{date_str}.log"
+    return f"{USAGE_DIR}{os.sep}{date_str}.bits"
+
+
+def _legacy_minutes(date_str, limit=None):
+    """Minutes recorded in a pre-bitmap text log (one HH:MM per line).
+
+    Stops reading once `limit` distinct minutes have been seen.
+    """
+    path = USAGE_DIR / f"{date_str}.log"
+    try:
+        raw = path.read_bytes()
+    except FileNotFoundError:
+        return set()
+    minutes = set()
+    for line in set(raw.splitlines()):  # dedup repeat prompts before parsing
+        try:
+            minutes.add(parse_time(line.strip().decode("ascii")))
+        except (ValueError, UnicodeDecodeError):
+            continue
+        if limit is not None and len(minutes) >= limit:
+            break
+    return minutes
+
+
+def _set_minutes(date_str, minutes):
+    """Set `minutes` in the day's bitmap: one locked read-modify-write.
+
+    A new day's bitmap is seeded from a legacy text log left by an older
+    version. Nothing is written when every minute is already set.
+    """
+    fd = os.open(usage_file_for(date_str), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        bits = bytearray(os.pread(fd, USAGE_BITMAP_BYTES, 0))
+        seeded = len(bits) < USAGE_BITMAP_BYTES
+        if seeded:
+            bits = bytearray(USAGE_BITMAP_BYTES)
+            minutes = set(minutes) | _legacy_minutes(date_str)
+        before = bytes(bits)
+        for m in minutes:
+            bits[m // 8] |= 1 << (m % 8)
+        if seeded or bits != before:  # repeat prompts in the same minute need no write
+            os.pwrite(fd, bytes(bits), 0)
+        if seeded:
+            (USAGE_DIR / f"{date_str}.log").unlink(missing_ok=True)
+    finally:
+        os.close(fd)  # also releases the lock
 
 
 def record_prompt(now):
-    date_str = now.strftime("%Y-%m-%d")
-    path = usage_file_for(date_str)
-    with open(path, "a") as f:
-        f.write(f"{now.strftime('%H:%M')}\n")
+    _set_minutes(_date_str(now), (now.hour * 60 + now.minute,))
+
 
+def record_prompts(dts):
+    """Record many prompts at once: one locked read-modify-write per day."""
+    by_date = {}
+    for dt in dts:
+        by_date.setdefault(_date_str(dt), set()).add(dt.hour * 60 + dt.minute)
+    for date_str, minutes in by_date.items():
+        _set_minutes(date_str, minutes)
 
-def get_active_minutes(now):
-    date_str = now.strftime("%Y-%m-%d")
+
+_POPCOUNT = bytes(bin(i).count("1") for i in range(256))  # set bits per byte value
+
+
+def _popcount(buf):
+    """Count set bits in `buf`. Table-driven: int.bit_count needs Python 3.10+."""
+    return sum(buf.translate(_POPCOUNT))
+
+
+def get_active_minutes(now, limit=None):
+    """Count active minutes today.
+
+    With `limit`, counting stops as soon as the running total reaches it, so
+    the result is exact below the limit and only guaranteed >= limit above it.
+    """
+    date_str = _date_str(now)
     path = usage_file_for(date_str)
-    if not path.exists():
-        return 0
-    seen = set()
-    with open(path) as f:
-        for line in f:
-            seen.add(line.strip())
-    return len(seen)
+    try:
+        with open(path, "rb") as f:
+            buf = f.read()
+    except FileNotFoundError:
+        return len(_legacy_minutes(date_str, limit))
+    if limit is None:
+        return _popcount(buf)
+    used = 0
+    for i in range(0, len(buf), 8):
+        used += _popcount(buf[i:i + 8])
+        if used >= limit:
+            break
+    return used
+
+
+_USAGE_SUFFIXES = (".bits", ".log", ".cnt", ".extensions.json", ".extensions.json.migrated")
 
 
 def cleanup_old_usage(now, keep_days=7):
-    if not USAGE_DIR.exists():
+    # Compare dates only (avoids naive/aware datetime issues). ISO dates sort
+    # as strings, so the filename prefix is compared without parsing it.
+    cutoff = _date_str(now.replace(tzinfo=None) - timedelta(days=keep_days))
+    try:
+        entries = os.scandir(USAGE_DIR)
+    except FileNotFoundError:
         return
-    # Compare dates only (avoids naive/aware datetime issues)
-    cutoff_date = (now.replace(tzinfo=None) - timedelta(days=keep_days)).date()
-    for p in USAGE_DIR.glob("*.log"):
-        try:
-            file_date = datetime.strptime(p.stem, "%Y-%m-%d").date()
-            if file_date < cutoff_date:
-                p.unlink()
-        except (ValueError, OSError):
-            pass
-    # Also clean old extension logs
-    for p in USAGE_DIR.glob("*.extensions.json"):
-        try:
-            date_part = p.stem.replace(".extensions", "")
-            file_date = datetime.strptime(date_part, "%Y-%m-%d").date()
-            if file_date < cutoff_date:
-                p.unlink()
-        except (ValueError, OSError):
-            pass
+    with entries:
+        for entry in entries:
+            name = entry.name
+            # Day files are named YYYY-MM-DD<suffix>
+            if (
+                name[:10] >= cutoff
+                or not name.endswith(_USAGE_SUFFIXES)
+                or name[10:11] != "."
+                or not (name[0:4] + name[5:7] + name[8:10]).isdigit()
+                or name[4:5] != "-"
+                or name[7:8] != "-"
+            ):
+                continue
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
 
 
 def maybe_cleanup(now, keep_days=7):
     """Run cleanup at most once per day, tracked by a marker file."""
-    if not USAGE_DIR.exists():
-        return
+    today_str = _date_str(now)
     marker = USAGE_DIR / ".last_cleanup"
-    today_str = now.strftime("%Y-%m-%d")
-    if marker.exists():
+    try:
+        done = marker.read_text().strip() == today_str
+    except FileNotFoundError:
+        if not USAGE_DIR.exists():
+            return  # nothing recorded yet, so nothing to clean
+        done = False
+    except OSError:
+        done = False
+    if not done:
+        cleanup_old_usage(now, keep_days)
         try:
-            if marker.read_text().strip() == today_str:
-                return
+            marker.write_text(today_str)
         except OSError:
             pass
-    cleanup_old_usage(now, keep_days)
-    try:
-        USAGE_DIR.mkdir(parents=True, exist_ok=True)
-        marker.write_text(today_str)
-    except OSError:
-        pass
 
 
 # ═══════════════════════════════════════════════════════════════════
 # Extensions
 # ═══════════════════════════════════════════════════════════════════
 
+# One YYYY-MM-DD.<type>.cnt file per extension type; each use appends one
+# byte, so the count is the file size. O_APPEND makes the write atomic.
+
+def _extension_count_path(date_str, ext_type):
+    return f"{USAGE_DIR}{os.sep}{date_str}.{ext_type}.cnt"
+
+
+def _append_bytes(path, data):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _migrate_legacy_extensions(date_str):
+    """Convert a YYYY-MM-DD.extensions.json from an older version to .cnt files.
+
+    The counts are in place before the JSON is retired, so a concurrent
+    reader always sees one or the other. Each .cnt file is written under a
+    temp name and hard-linked into place, which fails if another process
+    already migrated it, so racing migrators can't double-count.
+    """
+    legacy = USAGE_DIR / f"{date_str}.extensions.json"
+    try:
+        data = _read_json(legacy)
+    except (OSError, json.JSONDecodeError):
+        return
+    if isinstance(data, dict):
+        for ext_type, count in data.items():
+            if isinstance(count, int) and count > 0:
+                path = _extension_count_path(date_str, ext_type)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                try:
+                    _append_bytes(tmp_path, b"x" * count)
+                    os.link(tmp_path, path)
+                except FileExistsError:
+                    pass  # already migrated by another process
+                finally:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+    try:
+        os.rename(legacy, legacy.with_name(legacy.name + ".migrated"))
+    except OSError:
+        pass
+
+
+def extension_counts_today(now):
+    """Return {ext_type: uses today} for every type used today, in one directory scan."""
+    date_str = _date_str(now)
+    _migrate_legacy_extensions(date_str)
+    prefix = f"{date_str}."
+    counts = {}
+    try:
+        entries = os.scandir(USAGE_DIR)
+    except FileNotFoundError:
+        return counts
+    with entries:
+        for entry in entries:
+            name = entry.name
+            if name.startswith(prefix) and name.endswith(".cnt"):
+                try:
+                    counts[name[len(prefix):-len(".cnt")]] = entry.stat().st_size
+                except OSError:
+                    pass
+    return counts
+
+
 def count_extensions_today(now, ext_type):
-    date_str = now.strftime("%Y-%m-%d")
-    log_path = USAGE_DIR / f"{date_str}.extensions.json"
-    if not log_path.exists():
-        return 0
+    date_str = _date_str(now)
+    _migrate_legacy_extensions(date_str)
     try:
-        data = json.loads(log_path.read_text())
-        return data.get(ext_type, 0)
-    except (json.JSONDecodeError, OSError):
+        return os.stat(_extension_count_path(date_str, ext_type)).st_size
+    except OSError:
         return 0
 
 
 def record_extension(now, ext_type):
     USAGE_DIR.mkdir(parents=True, exist_ok=True)
-    date_str = now.strftime("%Y-%m-%d")
-    log_path = USAGE_DIR / f"{date_str}.extensions.json"
-    lock_path = log_path.with_suffix(".lock")
-    with open(lock_path, "w") as lock_file:
-        fcntl.flock(lock_file, fcntl.LOCK_EX)
-        data = {}
-        if log_path.exists():
-            try:
-                data = json.loads(log_path.read_text())
-            except (json.JSONDecodeError, OSError):
-                pass
-        data[ext_type] = data.get(ext_type, 0) + 1
-        log_path.write_text(json.dumps(data))
+    date_str = _date_str(now)
+    _migrate_legacy_extensions(date_str)
+    _append_bytes(_extension_count_path(date_str, ext_type), b"x")
 
 
 # ═══════════════════════════════════════════════════════════════════
 # Override checking
 # ═══════════════════════════════════════════════════════════════════
 
+_TRUTHY = frozenset({"1", "true", "yes", "True", "Yes", "TRUE", "YES"})
+
+
 def get_override_path(config):
     ov = config.get("override", {})
     return Path(os.path.expanduser(ov.get("file", "~/.balance_override")))
 
 
+_OVERRIDE_CACHE = None  # ((path, mtime_ns, size), parsed) for the last override file read
+
+
+def _parse_override(ov_path):
+    """Return (label, naive expiry) from an override file, or None if it isn't JSON-format."""
+    try:
+        data = _read_json(ov_path)
+        expires_at = datetime.fromisoformat(data["expires_at"])
+        label = data.get("label", data.get("type", "override"))
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError, OSError):
+        return None
+    return label, expires_at.replace(tzinfo=None) if expires_at.tzinfo else expires_at
+
+
 def check_override(config, now):
-    """Full bypass override. Returns (active, info_str)."""
+    """Full bypass override. Returns (active, info_str).
+
+    The override file is only re-parsed when its mtime or size changes.
+    """
+    global _OVERRIDE_CACHE
     ov = config.get("override", {})
 
     env_var = ov.get("env_var", "BALANCE_OVERRIDE")
-    if os.environ.get(env_var, "").strip() in ("1", "true", "yes"):
+    val = os.environ.get(env_var)
+    if val and val.strip() in _TRUTHY:
         return True, "environment variable"
 
     ov_path = get_override_path(config)
-    if ov_path.exists():
-        try:
-            data = json.loads(ov_path.read_text())
-            expires_at = datetime.fromisoformat(data["expires_at"])
-            now_naive = now.replace(tzinfo=None) if now.tzinfo else now
-            expires_naive = expires_at.replace(tzinfo=None) if expires_at.tzinfo else expires_at
-
-            if now_naive < expires_naive:
-                remaining = (expires_naive - now_naive).total_seconds() / 60
-                label = data.get("label", data.get("type", "override"))
-                return True, f"{label} \u2014 {int(remaining)}m remaining"
-            else:
-                ov_path.unlink(missing_ok=True)
-        except (json.JSONDecodeError, KeyError, ValueError, OSError):
-            try:
-                age_h = (time.time() - ov_path.stat().st_mtime) / 3600
-                if age_h < 1:
-                    return True, "override file (legacy format)"
-                ov_path.unlink(missing_ok=True)
-            except OSError:
-                pass
+    try:
+        st = ov_path.stat()
+    except OSError:
+        return False, ""
+
+    key = (str(ov_path), st.st_mtime_ns, st.st_size)
+    if _OVERRIDE_CACHE is not None and _OVERRIDE_CACHE[0] == key:
+        parsed = _OVERRIDE_CACHE[1]
+    else:
+        parsed = _parse_override(ov_path)
+        _OVERRIDE_CACHE = (key, parsed)
+
+    if parsed is not None:
+        label, expires_naive = parsed
+        now_naive = now.replace(tzinfo=None) if now.tzinfo else now
+        if now_naive < expires_naive:
+            remaining = (expires_naive - now_naive).total_seconds() / 60
+            return True, f"{label} \u2014 {int(remaining)}m remaining"
+    else:
+        # Legacy format: honour the file for an hour after it was written
+        age_h = (time.time() - st.st_mtime) / 3600
+        if age_h < 1:
+            return True, "override file (legacy format)"
 
+    try:
+        ov_path.unlink(missing_ok=True)
+    except OSError:
+        pass
     return False, ""
@@ -51,13 +51,18 @@ fi
 # Balance usage
 BALANCE_DIR="$HOME/.claude/hooks"
 BALANCE_CFG="$BALANCE_DIR/balance.json"
-USAGE_FILE="$BALANCE_DIR/.usage/$(date +%Y-%m-%d).log"
+USAGE_FILE="$BALANCE_DIR/.usage/$(date +%Y-%m-%d).bits"
+LEGACY_USAGE_FILE="$BALANCE_DIR/.usage/$(date +%Y-%m-%d).log"
 balance_str=""
 
 if [ -f "$BALANCE_CFG" ]; then
-    # Active minutes today
+    # Active minutes today (popcount of the per-minute bitmap)
     if [ -f "$USAGE_FILE" ]; then
-        active_min=$(sort -u "$USAGE_FILE" | wc -l | tr -d ' ')
+        active_min=$(od -An -v -tu1 "$USAGE_FILE" | awk '
+            { for (i = 1; i <= NF; i++) { b = $i; while (b) { n += b % 2; b = int(b / 2) } } }
+            END { print n + 0 }')
+    elif [ -f "$LEGACY_USAGE_FILE" ]; then
+        active_min=$(sort -u "$LEGACY_USAGE_FILE" | wc -l | tr -d ' ')
     else
         active_min=0
     fi
@@ -94,14 +99,18 @@ if [ -f "$BALANCE_CFG" ]; then
         fi
     fi
 
-    # Count extensions used today
-    EXT_FILE="$BALANCE_DIR/.usage/$(date +%Y-%m-%d).extensions.json"
-    ext_str=""
+    # Count extensions used today (one byte per use in YYYY-MM-DD.<type>.cnt)
+    TODAY_PREFIX="$BALANCE_DIR/.usage/$(date +%Y-%m-%d)"
+    ext_total=$(cat "$TODAY_PREFIX".*.cnt 2>/dev/null | wc -c | tr -d ' ')
+    EXT_FILE="$TODAY_PREFIX.extensions.json"
     if [ -f "$EXT_FILE" ]; then
-        ext_total=$(jq '[.[] | numbers] | add // 0' "$EXT_FILE" 2>/dev/null)
-        if [ "${ext_total:-0}" -gt 0 ]; then
-            ext_str=" ext:${ext_total}"
-        fi
+        # Legacy counter file not yet migrated by the hook
+        legacy_total=$(jq '[.[] | numbers] | add // 0' "$EXT_FILE" 2>/dev/null)
+        ext_total=$(( ext_total + ${legacy_total:-0} ))
+    fi
+    ext_str=""
+    if [ "${ext_total:-0}" -gt 0 ]; then
+        ext_str=" ext:${ext_total}"
     fi
 
     if [ -n "$sched_json" ] && [ "$sched_json" != "null" ]; then
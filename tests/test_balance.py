@@ -3,24 +3,49 @@ Tests for Balance.
 
 Run from repo root: python3 tests/test_balance.py
 Or: cd tests && python3 test_balance.py
+
+Runs in parallel under pytest-xdist when pytest and pytest-xdist are
+installed, otherwise serially with unittest.
 """
 
+import copy
+import functools
+import importlib.machinery
+import importlib.util
+import io
 import json
 import os
+import pickle
 import sys
 import tempfile
 import shutil
-from datetime import datetime, timedelta
+import subprocess
+import types
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from unittest import TestCase, main as unittest_main
+from unittest import TestCase, main as unittest_main, skipUnless
 from unittest.mock import patch
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Ensure the repo root (where balance_hook.py and balance_utils.py live) is on the path
 REPO_ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(REPO_ROOT))
 
+import balance_hook
 import balance_utils
 
+# Fixture JSON goes through orjson when installed, same as balance_utils
+if orjson is not None:
+    def _dumps(obj):
+        return orjson.dumps(obj).decode()
+    _loads = orjson.loads
+else:
+    _dumps, _loads = json.dumps, json.loads
+
 
 # ═══════════════════════════════════════════════════════════════════
 # Test fixtures
@@ -54,62 +79,218 @@ SAMPLE_CONFIG = {
 }
 
 
+def _precompile(config):
+    """Deep-copy a config and add the derived lookups load_config builds.
+
+    The copy shares nothing with `config`, and its schedules' windows are
+    parsed once here and then served from get_windows' cache.
+    """
+    cfg = balance_utils._merge_config(copy.deepcopy(config))
+    for sched in cfg["schedule"].values():
+        balance_utils.get_windows(sched)
+    return cfg
+
+
+# Read-only, load_config-shaped form of SAMPLE_CONFIG for tests that don't mutate it
+PARSED_SAMPLE_CONFIG = _precompile(SAMPLE_CONFIG)
+
+# SAMPLE_CONFIG with a weekday schedule that has no daily limit
+NO_CAP_CONFIG = _precompile({
+    **SAMPLE_CONFIG,
+    "schedule": {
+        "weekday": {
+            "days": [1, 2, 3, 4, 5],
+            "windows": [{"start": "08:00", "end": "18:00"}],
+        }
+    },
+})
+
+# Pre-encoded file bodies for the cleanup fixtures
+_BITS_BYTES = bytes(balance_utils.USAGE_BITMAP_BYTES)
+_EXT_BYTES = b"{}"
+
+# The only keys build_warnings reads, at SAMPLE_CONFIG's values
+MINI_CFG = {"warning_minutes_before_end": 15, "warning_minutes_before_cap": 30}
+
+
+@functools.lru_cache(maxsize=256)
 def make_dt(year=2026, month=2, day=24, hour=10, minute=0):
-    """Create a naive datetime. 2026-02-24 is a Tuesday (isoweekday=2)."""
+    """Create a naive datetime. 2026-02-24 is a Tuesday (isoweekday=2).
+
+    Cached: datetimes are immutable, so tests can share instances.
+    """
     return datetime(year, month, day, hour, minute)
 
 
+# Fixed instants reused across classes
+TUE_1000 = make_dt()  # the default instant most tests use
+TUE_2000 = make_dt(hour=20)
+SAT_0900 = datetime(2026, 2, 28, 9, 0)
+SAT_1200 = datetime(2026, 2, 28, 12, 0)
+SAT_1700 = datetime(2026, 2, 28, 17, 0)
+SUN_1000 = datetime(2026, 3, 1, 10, 0)
+
+
+def minute_of(dt):
+    """Minutes since midnight, as the hook computes it once per prompt."""
+    return dt.hour * 60 + dt.minute
+
+
+_CLI_CACHE = {}  # (path, mtime_ns) -> executed balance-extend module
+
+
+def _load_cli():
+    """Load balance-extend (no .py suffix, so by path), reusing it until the file changes."""
+    path = REPO_ROOT / "balance-extend"
+    key = (str(path), path.stat().st_mtime_ns)
+    mod = _CLI_CACHE.get(key)
+    if mod is None:
+        loader = importlib.machinery.SourceFileLoader("balance_extend", str(path))
+        mod = types.ModuleType(loader.name)
+        loader.exec_module(mod)
+        _CLI_CACHE[key] = mod
+    return mod
+
+
+# Keep the per-test temp dirs in RAM where a tmpfs is available (Linux)
+_TMP_PARENT = "/dev/shm" if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK) else None
+
+
+class TempDirTestCase(TestCase):
+    """Gives each test a fresh self.tmpdir.
+
+    Each test's directory lives under one per-class root, which is removed
+    in a single rmtree when the class finishes instead of once per test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._tmp_root = tempfile.mkdtemp(dir=_TMP_PARENT)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._tmp_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.tmpdir = Path(tempfile.mkdtemp(dir=self._tmp_root))
+
+
+class UsageDirTestCase(TempDirTestCase):
+    """Points USAGE_DIR at the test's fresh tmpdir."""
+
+    def setUp(self):
+        super().setUp()
+        self._orig_usage_dir = balance_utils.USAGE_DIR
+        balance_utils.USAGE_DIR = self.tmpdir
+
+    def tearDown(self):
+        balance_utils.USAGE_DIR = self._orig_usage_dir
+
+
 # ═══════════════════════════════════════════════════════════════════
 # Time helpers
 # ═══════════════════════════════════════════════════════════════════
 
 class TestParseTime(TestCase):
-    def test_midnight(self):
-        self.assertEqual(balance_utils.parse_time("00:00"), 0)
+    CASES = [
+        ("00:00", 0),
+        ("12:00", 720),
+        ("23:59", 1439),
+        ("08:30", 510),
+        ("8:30", 510),  # single-digit hour
+    ]
+
+    def test_parse(self):
+        for s, expected in self.CASES:
+            with self.subTest(s=s):
+                self.assertEqual(balance_utils.parse_time(s), expected)
+
+    def test_common_forms_skip_slow_path(self):
+        with patch.object(balance_utils, "_slow_parse_time", side_effect=AssertionError("slow path")):
+            for s, expected in self.CASES:
+                with self.subTest(s=s):
+                    self.assertEqual(balance_utils.parse_time(s), expected)
+
+    def test_invalid_raises(self):
+        for bad in ("24:00", "12:60", "noon", "12", None, ["08:00"]):
+            with self.subTest(bad=bad), self.assertRaises(ValueError):
+                balance_utils.parse_time(bad)
+
 
-    def test_noon(self):
-        self.assertEqual(balance_utils.parse_time("12:00"), 720)
+class TestFmtMinutes(TestCase):
+    CASES = [
+        (0, "00:00"),
+        (720, "12:00"),
+        (930, "15:30"),
+        (1440, "24:00"),  # end-of-day boundary
+    ]
 
-    def test_end_of_day(self):
-        self.assertEqual(balance_utils.parse_time("23:59"), 1439)
+    def test_format(self):
+        for m, expected in self.CASES:
+            with self.subTest(m=m):
+                self.assertEqual(balance_utils.fmt_minutes(m), expected)
 
-    def test_morning(self):
-        self.assertEqual(balance_utils.parse_time("08:30"), 510)
+    def test_round_trip(self):
+        for m in range(1440):
+            self.assertEqual(balance_utils.parse_time(balance_utils.fmt_minutes(m)), m)
 
 
-class TestFmtMinutes(TestCase):
-    def test_midnight(self):
-        self.assertEqual(balance_utils.fmt_minutes(0), "00:00")
+class TestDateStr(TestCase):
+    def test_matches_strftime(self):
+        for dt in (TUE_1000, datetime(2026, 1, 2), datetime(2026, 12, 31, 23, 59)):
+            with self.subTest(dt=dt):
+                self.assertEqual(balance_utils._date_str(dt), dt.strftime("%Y-%m-%d"))
 
-    def test_noon(self):
-        self.assertEqual(balance_utils.fmt_minutes(720), "12:00")
 
-    def test_afternoon(self):
-        self.assertEqual(balance_utils.fmt_minutes(930), "15:30")
+class TestGetNow(TestCase):
+    @skipUnless(balance_utils.ZoneInfo, "zoneinfo needs Python 3.9+")
+    def test_aware_in_requested_zone(self):
+        now = balance_utils.get_now("Asia/Tokyo")
+        self.assertEqual(now.utcoffset(), timedelta(hours=9))
 
+    @skipUnless(balance_utils.ZoneInfo, "zoneinfo needs Python 3.9+")
+    def test_zone_lookup_cached(self):
+        self.assertIs(balance_utils._tz("Europe/London"), balance_utils._tz("Europe/London"))
 
-class TestGetWindows(TestCase):
-    def test_new_format(self):
-        sched = {"windows": [{"start": "08:00", "end": "18:00"}]}
-        self.assertEqual(balance_utils.get_windows(sched), [(480, 1080)])
+    def test_unknown_zone_falls_back(self):
+        self.assertIsInstance(balance_utils.get_now("Not/AZone"), datetime)
+
+    def test_without_zoneinfo_uses_tz_env(self):
+        with patch.object(balance_utils, "ZoneInfo", None):
+            now = balance_utils.get_now("Asia/Tokyo")
+        self.assertIsNone(now.tzinfo)
+        utc_now = datetime.now(timezone.utc).replace(tzinfo=None)
+        self.assertAlmostEqual((now - utc_now).total_seconds(), 9 * 3600, delta=60)
 
-    def test_multi_window(self):
-        sched = {
-            "windows": [
-                {"start": "08:00", "end": "10:30"},
-                {"start": "16:00", "end": "19:00"},
-            ]
-        }
-        result = balance_utils.get_windows(sched)
-        self.assertEqual(result, [(480, 630), (960, 1140)])
 
-    def test_legacy_format(self):
-        sched = {"start_hour": 9, "end_hour": 17}
-        self.assertEqual(balance_utils.get_windows(sched), [(540, 1020)])
+class TestGetWindows(TestCase):
+    CASES = [
+        ("new_format", {"windows": [{"start": "08:00", "end": "18:00"}]}, [(480, 1080)]),
+        ("multi_window", {"windows": [{"start": "08:00", "end": "10:30"},
+                                      {"start": "16:00", "end": "19:00"}]}, [(480, 630), (960, 1140)]),
+        ("legacy_format", {"start_hour": 9, "end_hour": 17}, [(540, 1020)]),
+        ("legacy_with_minutes", {"start_hour": 8, "start_minute": 30,
+                                 "end_hour": 17, "end_minute": 45}, [(510, 1065)]),
+    ]
+
+    def test_windows(self):
+        for name, sched, expected in self.CASES:
+            with self.subTest(name):
+                self.assertEqual(balance_utils.get_windows(sched), expected)
+
+    def test_repeat_call_skips_parse(self):
+        sched = {"windows": [{"start": "08:00", "end": "18:00"}]}
+        first = balance_utils.get_windows(sched)
+        with patch.object(balance_utils, "parse_time", side_effect=AssertionError("re-parsed")):
+            self.assertIs(balance_utils.get_windows(sched), first)
 
-    def test_legacy_with_minutes(self):
-        sched = {"start_hour": 8, "start_minute": 30, "end_hour": 17, "end_minute": 45}
-        self.assertEqual(balance_utils.get_windows(sched), [(510, 1065)])
+    def test_distinct_schedules_cached_separately(self):
+        a = {"windows": [{"start": "08:00", "end": "18:00"}]}
+        b = {"windows": [{"start": "09:00", "end": "17:00"}]}
+        self.assertEqual(balance_utils.get_windows(a), [(480, 1080)])
+        self.assertEqual(balance_utils.get_windows(b), [(540, 1020)])
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -136,6 +317,23 @@ class TestFindSchedule(TestCase):
             name, _ = balance_utils.find_schedule(SAMPLE_CONFIG, day)
             self.assertEqual(name, "weekday", f"Day {day} should match weekday")
 
+    def test_day_index_matches_scan(self):
+        for day in range(1, 8):
+            self.assertEqual(
+                balance_utils.find_schedule(PARSED_SAMPLE_CONFIG, day),
+                balance_utils.find_schedule(SAMPLE_CONFIG, day),
+            )
+
+    def test_day_index_first_block_wins(self):
+        schedule = {
+            "a": {"days": [1, 2], "windows": []},
+            "b": {"days": [2, 3], "windows": []},
+        }
+        index = balance_utils._build_day_index(schedule)
+        self.assertEqual(index[2][0], "a")
+        self.assertEqual(index[3][0], "b")
+        self.assertEqual(index[7], (None, None))
+
 
 # ═══════════════════════════════════════════════════════════════════
 # Window checks
@@ -185,6 +383,19 @@ class TestInAnyWindow(TestCase):
         inside, _, _ = balance_utils.in_any_window(self.multi, 700)  # 11:40 — gap
         self.assertFalse(inside)
 
+    def test_unsorted_windows(self):
+        windows = [(960, 1140), (480, 630)]
+        self.assertEqual(balance_utils.in_any_window(windows, 540), (True, 480, 630))
+        self.assertEqual(balance_utils.in_any_window(windows, 1000), (True, 960, 1140))
+
+    def test_overlapping_windows_merged(self):
+        windows = [(480, 1080), (600, 700)]  # second nested inside the first
+        self.assertEqual(balance_utils.in_any_window(windows, 650), (True, 480, 1080))
+        self.assertEqual(balance_utils.in_any_window(windows, 750), (True, 480, 1080))
+
+    def test_empty_window_never_matches(self):
+        self.assertEqual(balance_utils.in_any_window([(1320, 120)], 1380), (False, None, None))
+
 
 class TestNextWindowToday(TestCase):
     def test_next_window_exists(self):
@@ -202,26 +413,44 @@ class TestNextWindowToday(TestCase):
         result = balance_utils.next_window_today(windows, 300)  # 05:00
         self.assertEqual(result, (480, 630))
 
+    def test_unsorted_windows(self):
+        windows = [(960, 1140), (480, 630), (720, 780)]
+        result = balance_utils.next_window_today(windows, 300)
+        self.assertEqual(result, (480, 630))
+
 
 class TestNextAvailable(TestCase):
     def test_later_today_same_schedule(self):
         # Saturday at 12:00 — second window starts at 16:00
-        now = datetime(2026, 2, 28, 12, 0)  # Saturday
-        result = balance_utils.next_available(SAMPLE_CONFIG, now)
+        now = SAT_1200
+        result = balance_utils.next_available(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertEqual(result, "today at 16:00")
 
     def test_next_day(self):
         # Sunday at 10:00 — no Sunday schedule, next is Monday
-        now = datetime(2026, 3, 1, 10, 0)  # Sunday
-        result = balance_utils.next_available(SAMPLE_CONFIG, now)
+        now = SUN_1000
+        result = balance_utils.next_available(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertEqual(result, "Monday at 08:00")
 
     def test_after_all_windows_today(self):
         # Tuesday at 20:00 — next is Wednesday 08:00
         now = datetime(2026, 2, 24, 20, 0)
-        result = balance_utils.next_available(SAMPLE_CONFIG, now)
+        result = balance_utils.next_available(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertEqual(result, "Wednesday at 08:00")
 
+    def test_wraps_past_sunday(self):
+        now = datetime(2026, 2, 28, 20, 0)  # Saturday after the last window
+        result = balance_utils.next_available(PARSED_SAMPLE_CONFIG, now, minute_of(now))
+        self.assertEqual(result, "Monday at 08:00")
+
+    def test_skips_day_with_only_empty_window(self):
+        config = _precompile({"schedule": {
+            "odd": {"days": [3], "windows": [{"start": "10:00", "end": "10:00"}]},
+            "thu": {"days": [4], "windows": [{"start": "09:30", "end": "12:00"}]},
+        }})
+        now = TUE_2000
+        self.assertEqual(balance_utils.next_available(config, now, minute_of(now)), "Thursday at 09:30")
+
 
 class TestWindowsSummary(TestCase):
     def test_single(self):
@@ -242,55 +471,102 @@ class TestWindowsSummary(TestCase):
 # Usage tracking
 # ═══════════════════════════════════════════════════════════════════
 
-class TestUsageTracking(TestCase):
-    def setUp(self):
-        self.tmpdir = Path(tempfile.mkdtemp())
-        self._orig_usage_dir = balance_utils.USAGE_DIR
-        balance_utils.USAGE_DIR = self.tmpdir
-
-    def tearDown(self):
-        balance_utils.USAGE_DIR = self._orig_usage_dir
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
-
+class TestUsageTracking(UsageDirTestCase):
     def test_no_usage_file(self):
-        now = make_dt(hour=10)
+        now = TUE_1000
         self.assertEqual(balance_utils.get_active_minutes(now), 0)
 
     def test_record_and_count(self):
-        now = make_dt(hour=10, minute=0)
+        now = TUE_1000
         balance_utils.record_prompt(now)
         self.assertEqual(balance_utils.get_active_minutes(now), 1)
 
     def test_dedup_same_minute(self):
-        now = make_dt(hour=10, minute=0)
+        now = TUE_1000
         balance_utils.record_prompt(now)
         balance_utils.record_prompt(now)
         balance_utils.record_prompt(now)
         self.assertEqual(balance_utils.get_active_minutes(now), 1)
 
-    def test_different_minutes(self):
-        for m in range(5):
-            now = make_dt(hour=10, minute=m)
+    def test_same_minute_skips_write(self):
+        now = TUE_1000
+        balance_utils.record_prompt(now)
+        with patch.object(balance_utils.os, "pwrite", side_effect=AssertionError("rewrote bit")):
             balance_utils.record_prompt(now)
-        self.assertEqual(balance_utils.get_active_minutes(make_dt(hour=10)), 5)
+        self.assertEqual(balance_utils.get_active_minutes(now), 1)
+
+    def test_different_minutes(self):
+        balance_utils.record_prompts([make_dt(hour=10, minute=m) for m in range(5)])
+        self.assertEqual(balance_utils.get_active_minutes(TUE_1000), 5)
+
+    def test_record_prompts_merges_with_existing(self):
+        balance_utils.record_prompt(make_dt(hour=9, minute=0))
+        balance_utils.record_prompts([make_dt(hour=9, minute=0), make_dt(hour=9, minute=1),
+                                      make_dt(day=25, hour=9, minute=0)])
+        self.assertEqual(balance_utils.get_active_minutes(TUE_1000), 2)
+        self.assertEqual(balance_utils.get_active_minutes(make_dt(day=25)), 1)
+
+    def test_limit_stops_counting_early(self):
+        balance_utils.record_prompts(make_dt(hour=8 + m // 60, minute=m % 60) for m in range(120))
+        now = TUE_1000
+        self.assertEqual(balance_utils.get_active_minutes(now, limit=500), 120)
+        used = balance_utils.get_active_minutes(now, limit=30)
+        self.assertGreaterEqual(used, 30)
+        self.assertLess(used, 120)
+
+    def test_bitmap_is_fixed_size(self):
+        for m in range(0, 1440, 7):
+            balance_utils.record_prompt(make_dt(hour=m // 60, minute=m % 60))
+        path = self.tmpdir / "2026-02-24.bits"
+        self.assertEqual(path.stat().st_size, 180)
+        self.assertEqual(balance_utils.get_active_minutes(TUE_1000), len(range(0, 1440, 7)))
+
+    def test_popcount_matches_bin(self):
+        # Must not rely on int.bit_count (3.10+); the table covers every byte value
+        buf = bytes(range(256)) + b"\xff\x00\x81"
+        self.assertEqual(balance_utils._popcount(buf), bin(int.from_bytes(buf, "little")).count("1"))
+
+    def test_legacy_log_counted(self):
+        (self.tmpdir / "2026-02-24.log").write_text("09:00\n09:00\n09:01\n")
+        self.assertEqual(balance_utils.get_active_minutes(TUE_1000), 2)
+
+    def test_legacy_log_skips_bad_lines(self):
+        (self.tmpdir / "2026-02-24.log").write_bytes(b"09:00\n\xff\xfe\nnoon\n 09:01 \n")
+        self.assertEqual(balance_utils.get_active_minutes(TUE_1000), 2)
+
+    def test_legacy_log_migrated_on_record(self):
+        (self.tmpdir / "2026-02-24.log").write_text("09:00\n09:01\n")
+        balance_utils.record_prompt(TUE_1000)
+        self.assertEqual(balance_utils.get_active_minutes(TUE_1000), 3)
+        self.assertFalse((self.tmpdir / "2026-02-24.log").exists())
 
     def test_cleanup_old_files(self):
-        now = make_dt()
+        now = TUE_1000
         for days_ago in range(10):
             dt = now - timedelta(days=days_ago)
             date_str = dt.strftime("%Y-%m-%d")
-            (self.tmpdir / f"{date_str}.log").write_text("10:00\n")
-            (self.tmpdir / f"{date_str}.extensions.json").write_text("{}")
+            (self.tmpdir / f"{date_str}.bits").write_bytes(_BITS_BYTES)
+            (self.tmpdir / f"{date_str}.extensions.json").write_bytes(_EXT_BYTES)
+
+        balance_utils.cleanup_old_usage(now, keep_days=7)
+
+        kept_dates = [(now - timedelta(days=d)).strftime("%Y-%m-%d") for d in range(8)]
+        expected = {f"{d}.bits" for d in kept_dates} | {f"{d}.extensions.json" for d in kept_dates}
+        self.assertEqual({p.name for p in self.tmpdir.iterdir()}, expected)
+
+    def test_cleanup_ignores_unrelated_files(self):
+        now = TUE_1000
+        keep = ["notes.log", "2020-01-01-backup.log", ".last_cleanup"]
+        for name in keep:
+            (self.tmpdir / name).write_text("x")
+        (self.tmpdir / "2020-01-01.log").write_text("10:00\n")
 
         balance_utils.cleanup_old_usage(now, keep_days=7)
 
-        remaining_logs = list(self.tmpdir.glob("*.log"))
-        remaining_ext = list(self.tmpdir.glob("*.extensions.json"))
-        self.assertEqual(len(remaining_logs), 8)
-        self.assertEqual(len(remaining_ext), 8)
+        self.assertEqual(sorted(p.name for p in self.tmpdir.iterdir()), sorted(keep))
 
     def test_maybe_cleanup_runs_once_per_day(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.maybe_cleanup(now)
         marker = self.tmpdir / ".last_cleanup"
         self.assertTrue(marker.exists())
@@ -307,123 +583,190 @@ class TestUsageTracking(TestCase):
         balance_utils.maybe_cleanup(tomorrow)
         self.assertFalse(old_file.exists())  # Cleaned on next day
 
+    def test_maybe_cleanup_without_usage_dir(self):
+        missing = self.tmpdir / "never-created"
+        with patch.object(balance_utils, "USAGE_DIR", missing):
+            balance_utils.maybe_cleanup(TUE_1000)
+        self.assertFalse(missing.exists())
+
 
 # ═══════════════════════════════════════════════════════════════════
 # Extensions
 # ═══════════════════════════════════════════════════════════════════
 
-class TestExtensions(TestCase):
-    def setUp(self):
-        self.tmpdir = Path(tempfile.mkdtemp())
-        self._orig_usage_dir = balance_utils.USAGE_DIR
-        balance_utils.USAGE_DIR = self.tmpdir
-
-    def tearDown(self):
-        balance_utils.USAGE_DIR = self._orig_usage_dir
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
-
+class TestExtensions(UsageDirTestCase):
     def test_no_extensions_used(self):
-        now = make_dt()
+        now = TUE_1000
         self.assertEqual(balance_utils.count_extensions_today(now, "quick"), 0)
 
     def test_record_and_count_extension(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.record_extension(now, "quick")
         self.assertEqual(balance_utils.count_extensions_today(now, "quick"), 1)
         self.assertEqual(balance_utils.count_extensions_today(now, "more"), 0)
 
     def test_multiple_extensions(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.record_extension(now, "quick")
         balance_utils.record_extension(now, "quick")
         balance_utils.record_extension(now, "more")
         self.assertEqual(balance_utils.count_extensions_today(now, "quick"), 2)
         self.assertEqual(balance_utils.count_extensions_today(now, "more"), 1)
 
+    def test_counts_for_all_types_in_one_call(self):
+        now = TUE_1000
+        balance_utils.record_extension(now, "quick")
+        balance_utils.record_extension(now, "more")
+        balance_utils.record_extension(now, "more")
+        balance_utils.record_extension(now - timedelta(days=1), "quick")
+        self.assertEqual(balance_utils.extension_counts_today(now), {"quick": 1, "more": 2})
+
+    def test_count_is_file_size(self):
+        now = TUE_1000
+        for _ in range(3):
+            balance_utils.record_extension(now, "quick")
+        self.assertEqual((self.tmpdir / "2026-02-24.quick.cnt").stat().st_size, 3)
+
+    def test_legacy_json_migrated(self):
+        now = TUE_1000
+        (self.tmpdir / "2026-02-24.extensions.json").write_text(_dumps({"quick": 2, "more": 1}))
+        self.assertEqual(balance_utils.count_extensions_today(now, "quick"), 2)
+        self.assertEqual(balance_utils.count_extensions_today(now, "more"), 1)
+        self.assertFalse((self.tmpdir / "2026-02-24.extensions.json").exists())
+
+        balance_utils.record_extension(now, "more")
+        self.assertEqual(balance_utils.count_extensions_today(now, "more"), 2)
+
+    def test_legacy_json_counted_until_retired(self):
+        now = TUE_1000
+        legacy = self.tmpdir / "2026-02-24.extensions.json"
+        legacy.write_text(_dumps({"quick": 2}))
+        # A migrator that wrote the counts but hasn't retired the JSON yet
+        with patch.object(balance_utils.os, "rename", side_effect=OSError):
+            self.assertEqual(balance_utils.count_extensions_today(now, "quick"), 2)
+        self.assertTrue(legacy.exists())
+        # A second migrator must not add the legacy counts again
+        self.assertEqual(balance_utils.extension_counts_today(now), {"quick": 2})
+        self.assertFalse(legacy.exists())
+        self.assertEqual(sorted(p.name for p in self.tmpdir.iterdir()),
+                         ["2026-02-24.extensions.json.migrated", "2026-02-24.quick.cnt"])
+
 
 # ═══════════════════════════════════════════════════════════════════
 # Override checking
 # ═══════════════════════════════════════════════════════════════════
 
-class TestOverride(TestCase):
+class TestOverride(TempDirTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Built once; check_override only reads "override", which setUp replaces
+        cls.config = copy.deepcopy(SAMPLE_CONFIG)
+
     def setUp(self):
-        self.tmpdir = Path(tempfile.mkdtemp())
+        super().setUp()
         self.override_file = self.tmpdir / "override.json"
-        self.config = {
-            **SAMPLE_CONFIG,
-            "override": {
-                "env_var": "TEST_BALANCE_OVERRIDE",
-                "file": str(self.override_file),
-            },
+        self.config["override"] = {
+            "env_var": "TEST_BALANCE_OVERRIDE",
+            "file": str(self.override_file),
         }
-        os.environ.pop("TEST_BALANCE_OVERRIDE", None)
-
-    def tearDown(self):
-        os.environ.pop("TEST_BALANCE_OVERRIDE", None)
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
 
     def test_no_override(self):
-        now = make_dt()
+        now = TUE_1000
         active, info = balance_utils.check_override(self.config, now)
         self.assertFalse(active)
 
     def test_env_var_override(self):
-        os.environ["TEST_BALANCE_OVERRIDE"] = "1"
-        now = make_dt()
-        active, info = balance_utils.check_override(self.config, now)
+        with patch.dict(os.environ, {"TEST_BALANCE_OVERRIDE": "1"}):
+            active, info = balance_utils.check_override(self.config, TUE_1000)
         self.assertTrue(active)
         self.assertIn("environment", info)
 
     def test_env_var_true(self):
-        os.environ["TEST_BALANCE_OVERRIDE"] = "true"
-        now = make_dt()
-        active, _ = balance_utils.check_override(self.config, now)
+        with patch.dict(os.environ, {"TEST_BALANCE_OVERRIDE": "true"}):
+            active, _ = balance_utils.check_override(self.config, TUE_1000)
+        self.assertTrue(active)
+
+    def test_env_var_uppercase(self):
+        with patch.dict(os.environ, {"TEST_BALANCE_OVERRIDE": " YES "}):
+            active, _ = balance_utils.check_override(self.config, TUE_1000)
         self.assertTrue(active)
 
     def test_env_var_no(self):
-        os.environ["TEST_BALANCE_OVERRIDE"] = "no"
-        now = make_dt()
-        active, _ = balance_utils.check_override(self.config, now)
+        with patch.dict(os.environ, {"TEST_BALANCE_OVERRIDE": "no"}):
+            active, _ = balance_utils.check_override(self.config, TUE_1000)
         self.assertFalse(active)
 
     def test_file_override_valid(self):
-        now = make_dt(hour=10)
+        now = TUE_1000
         expires = now + timedelta(minutes=30)
         data = {
             "type": "quick",
             "label": "Quick 15-min session",
             "expires_at": expires.isoformat(),
         }
-        self.override_file.write_text(json.dumps(data))
+        self.override_file.write_text(_dumps(data))
         active, info = balance_utils.check_override(self.config, now)
         self.assertTrue(active)
         self.assertIn("Quick", info)
         self.assertIn("remaining", info)
 
+    def test_unchanged_file_not_reparsed(self):
+        now = TUE_1000
+        data = {"type": "quick", "label": "Quick", "expires_at": (now + timedelta(minutes=30)).isoformat()}
+        self.override_file.write_text(_dumps(data))
+        balance_utils.check_override(self.config, now)
+        with patch.object(balance_utils, "_read_json", side_effect=AssertionError("re-parsed")):
+            active, info = balance_utils.check_override(self.config, now + timedelta(minutes=10))
+        self.assertTrue(active)
+        self.assertIn("20m remaining", info)
+
+    def test_rewritten_file_reparsed(self):
+        now = TUE_1000
+        self.override_file.write_text(_dumps({"label": "A", "expires_at": (now + timedelta(minutes=5)).isoformat()}))
+        balance_utils.check_override(self.config, now)
+        self.override_file.write_text(_dumps({"label": "Longer", "expires_at": (now + timedelta(minutes=50)).isoformat()}))
+        active, info = balance_utils.check_override(self.config, now)
+        self.assertTrue(active)
+        self.assertIn("Longer", info)
+
     def test_file_override_expired(self):
-        now = make_dt(hour=10)
+        now = TUE_1000
         expires = now - timedelta(minutes=5)
         data = {"type": "quick", "expires_at": expires.isoformat()}
-        self.override_file.write_text(json.dumps(data))
+        self.override_file.write_text(_dumps(data))
         active, _ = balance_utils.check_override(self.config, now)
         self.assertFalse(active)
         self.assertFalse(self.override_file.exists())  # Expired file cleaned up
 
+    def test_legacy_override_recent(self):
+        self.override_file.write_text("")
+        active, info = balance_utils.check_override(self.config, TUE_1000)
+        self.assertTrue(active)
+        self.assertIn("legacy", info)
+
+    def test_legacy_override_stale(self):
+        self.override_file.write_text("")
+        two_hours_ago = self.override_file.stat().st_mtime - 7200
+        os.utime(self.override_file, (two_hours_ago, two_hours_ago))
+        active, _ = balance_utils.check_override(self.config, TUE_1000)
+        self.assertFalse(active)
+        self.assertFalse(self.override_file.exists())
+
 
 # ═══════════════════════════════════════════════════════════════════
 # Config loading
 # ═══════════════════════════════════════════════════════════════════
 
-class TestLoadConfig(TestCase):
+class TestLoadConfig(TempDirTestCase):
     def setUp(self):
+        super().setUp()
         self._orig_path = balance_utils.CONFIG_PATH
-        self.tmpdir = Path(tempfile.mkdtemp())
         self.config_file = self.tmpdir / "config.json"
         balance_utils.CONFIG_PATH = self.config_file
 
     def tearDown(self):
         balance_utils.CONFIG_PATH = self._orig_path
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
 
     def test_missing_config_uses_defaults(self):
         config = balance_utils.load_config()
@@ -443,7 +786,7 @@ class TestLoadConfig(TestCase):
                 },
             },
         }
-        self.config_file.write_text(json.dumps(custom))
+        self.config_file.write_text(_dumps(custom))
         config = balance_utils.load_config()
         self.assertEqual(config["timezone"], "America/New_York")
         self.assertEqual(config["schedule"]["weekday"]["daily_limit_minutes"], 120)
@@ -454,102 +797,149 @@ class TestLoadConfig(TestCase):
         config = balance_utils.load_config()
         self.assertTrue(config["enabled"])
 
+    def test_unchanged_config_served_from_cache(self):
+        self.config_file.write_text(_dumps({"timezone": "Asia/Tokyo"}))
+        first = balance_utils.load_config()
+        self.assertIs(balance_utils.load_config(), first)
+
+    def test_pickle_sidecar_skips_json_parse(self):
+        self.config_file.write_text(_dumps({"timezone": "Asia/Tokyo"}))
+        balance_utils.load_config()
+        self.assertTrue(self.config_file.with_suffix(".cache.pickle").exists())
+
+        balance_utils._CONFIG_CACHE = None  # simulate a fresh hook process
+        with patch.object(balance_utils, "_read_json", side_effect=AssertionError("parsed JSON")):
+            config = balance_utils.load_config()
+        self.assertEqual(config["timezone"], "Asia/Tokyo")
+
+    def test_bad_pickle_sidecar_ignored(self):
+        self.config_file.write_text(_dumps({"timezone": "Asia/Tokyo"}))
+        st = self.config_file.stat()
+        key = (str(self.config_file), st.st_mtime_ns, st.st_size)
+        cache_path = self.config_file.with_suffix(".cache.pickle")
+        for payload in (b"", b"\x80\x05truncated",
+                        pickle.dumps((key,)),
+                        pickle.dumps((key, ["not", "a", "dict"]))):
+            with self.subTest(payload=payload[:16]):
+                cache_path.write_bytes(payload)
+                balance_utils._CONFIG_CACHE = None
+                self.assertEqual(balance_utils.load_config()["timezone"], "Asia/Tokyo")
+
+    def test_stdlib_json_fallback(self):
+        self.config_file.write_text(_dumps({"timezone": "Asia/Tokyo"}))
+        with patch.object(balance_utils, "orjson", None):
+            self.assertEqual(balance_utils._read_json(self.config_file)["timezone"], "Asia/Tokyo")
+            self.config_file.write_text("not json {{{")
+            with self.assertRaises(json.JSONDecodeError):
+                balance_utils._read_json(self.config_file)
+
+    def test_edited_config_reloaded(self):
+        self.config_file.write_text(_dumps({"timezone": "Asia/Tokyo"}))
+        balance_utils.load_config()
+        self.config_file.write_text(_dumps({"timezone": "America/New_York"}))
+        self.assertEqual(balance_utils.load_config()["timezone"], "America/New_York")
+
+    def test_warning_thresholds_precomputed(self):
+        self.config_file.write_text(_dumps({"warning_minutes_before_end": 5}))
+        config = balance_utils.load_config()
+        self.assertEqual((config["_warn_end"], config["_warn_cap"]), (5, 30))
+
+    def test_reload_clears_windows_cache(self):
+        self.config_file.write_text(_dumps({"timezone": "Asia/Tokyo"}))
+        sched = balance_utils.load_config()["schedule"]["weekday"]
+        windows = balance_utils.get_windows(sched)
+        balance_utils.load_config()  # unchanged: cache kept
+        self.assertIs(balance_utils.get_windows(sched), windows)
+
+        self.config_file.write_text(_dumps({"timezone": "America/New_York"}))
+        balance_utils.load_config()
+        self.assertNotIn(id(sched), balance_utils._WINDOWS_CACHE)
+
 
 # ═══════════════════════════════════════════════════════════════════
 # Hook enforcement (integration-style)
 # ═══════════════════════════════════════════════════════════════════
 
-class TestHookEnforcement(TestCase):
-    def setUp(self):
-        import balance_hook
-        self.tr = balance_hook
-
-        self.tmpdir = Path(tempfile.mkdtemp())
-        self._orig_usage_dir = balance_utils.USAGE_DIR
-        balance_utils.USAGE_DIR = self.tmpdir
-
-    def tearDown(self):
-        balance_utils.USAGE_DIR = self._orig_usage_dir
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
+class TestHookEnforcement(UsageDirTestCase):
+    tr = balance_hook
 
     def test_weekday_in_window(self):
-        now = make_dt(hour=10)  # Tuesday 10:00
-        in_win, name, sched, end_m, msg = self.tr.check_window(SAMPLE_CONFIG, now)
+        now = TUE_1000  # Tuesday 10:00
+        in_win, name, sched, end_m, msg = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertTrue(in_win)
         self.assertEqual(name, "weekday")
         self.assertEqual(end_m, 1080)  # 18:00
+        self.assertIsNone(msg)
 
     def test_weekday_before_window(self):
         now = make_dt(hour=6)  # Tuesday 06:00
-        in_win, _, _, _, msg = self.tr.check_window(SAMPLE_CONFIG, now)
+        in_win, _, _, _, msg = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertFalse(in_win)
-        self.assertIn("Outside allowed hours", msg)
+        self.assertIn("Outside allowed hours", msg())
 
     def test_weekday_after_window(self):
-        now = make_dt(hour=20)  # Tuesday 20:00
-        in_win, _, _, _, msg = self.tr.check_window(SAMPLE_CONFIG, now)
+        now = TUE_2000  # Tuesday 20:00
+        in_win, _, _, _, msg = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertFalse(in_win)
-        self.assertIn("Outside allowed hours", msg)
+        self.assertIn("Outside allowed hours", msg())
 
     def test_sunday_blocked(self):
-        now = datetime(2026, 3, 1, 10, 0)  # Sunday
-        in_win, _, _, _, msg = self.tr.check_window(SAMPLE_CONFIG, now)
+        now = SUN_1000
+        in_win, _, _, _, msg = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
+        self.assertFalse(in_win)
+        self.assertIn("offline today", msg())
+
+    def test_block_message_built_on_demand(self):
+        now = TUE_2000
+        with patch.object(self.tr, "next_available", side_effect=AssertionError("built eagerly")):
+            in_win, _, _, _, msg = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertFalse(in_win)
-        self.assertIn("offline today", msg)
+        self.assertIn("Next window", msg())
 
     def test_saturday_first_window(self):
-        now = datetime(2026, 2, 28, 9, 0)  # Saturday 09:00
-        in_win, name, _, end_m, _ = self.tr.check_window(SAMPLE_CONFIG, now)
+        now = SAT_0900
+        in_win, name, _, end_m, _ = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertTrue(in_win)
         self.assertEqual(name, "saturday")
         self.assertEqual(end_m, 630)  # 10:30
 
     def test_saturday_gap(self):
-        now = datetime(2026, 2, 28, 12, 0)  # Saturday 12:00 — in gap
-        in_win, _, _, _, msg = self.tr.check_window(SAMPLE_CONFIG, now)
+        now = SAT_1200  # in gap
+        in_win, _, _, _, msg = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertFalse(in_win)
-        self.assertIn("Outside allowed hours", msg)
+        self.assertIn("Outside allowed hours", msg())
 
     def test_saturday_second_window(self):
-        now = datetime(2026, 2, 28, 17, 0)  # Saturday 17:00
-        in_win, _, _, end_m, _ = self.tr.check_window(SAMPLE_CONFIG, now)
+        now = SAT_1700
+        in_win, _, _, end_m, _ = self.tr.check_window(PARSED_SAMPLE_CONFIG, now, minute_of(now))
         self.assertTrue(in_win)
         self.assertEqual(end_m, 1140)  # 19:00
 
     def test_cap_not_hit(self):
-        now = make_dt(hour=10)
-        _, sched = balance_utils.find_schedule(SAMPLE_CONFIG, now.isoweekday())
-        ok, used, limit, msg = self.tr.check_daily_cap(SAMPLE_CONFIG, sched, now)
+        now = TUE_1000
+        _, sched = balance_utils.find_schedule(PARSED_SAMPLE_CONFIG, now.isoweekday())
+        ok, used, limit, msg = self.tr.check_daily_cap(PARSED_SAMPLE_CONFIG, sched, now)
         self.assertTrue(ok)
+        self.assertIsNone(msg)
         self.assertEqual(used, 0)
         self.assertEqual(limit, 240)
 
     def test_cap_hit(self):
-        now = make_dt(hour=10)
-        for m in range(240):
-            h = 8 + m // 60
-            minute = m % 60
-            balance_utils.record_prompt(make_dt(hour=h, minute=minute))
-
-        _, sched = balance_utils.find_schedule(SAMPLE_CONFIG, now.isoweekday())
-        ok, used, limit, msg = self.tr.check_daily_cap(SAMPLE_CONFIG, sched, now)
+        now = TUE_1000
+        # 08:00-11:59 all active: set bits 480..719 of the day's bitmap in one write
+        bits = ((1 << 240) - 1) << 480
+        (self.tmpdir / now.strftime("%Y-%m-%d.bits")).write_bytes(bits.to_bytes(180, "little"))
+
+        _, sched = balance_utils.find_schedule(PARSED_SAMPLE_CONFIG, now.isoweekday())
+        ok, used, limit, msg = self.tr.check_daily_cap(PARSED_SAMPLE_CONFIG, sched, now)
         self.assertFalse(ok)
         self.assertEqual(used, 240)
-        self.assertIn("Daily limit reached", msg)
+        self.assertIn("Daily limit reached", msg())
 
     def test_no_cap_configured(self):
-        config = {
-            **SAMPLE_CONFIG,
-            "schedule": {
-                "weekday": {
-                    "days": [1, 2, 3, 4, 5],
-                    "windows": [{"start": "08:00", "end": "18:00"}],
-                }
-            },
-        }
-        now = make_dt(hour=10)
-        _, sched = balance_utils.find_schedule(config, now.isoweekday())
-        ok, _, limit, _ = self.tr.check_daily_cap(config, sched, now)
+        now = TUE_1000
+        _, sched = balance_utils.find_schedule(NO_CAP_CONFIG, now.isoweekday())
+        ok, _, limit, _ = self.tr.check_daily_cap(NO_CAP_CONFIG, sched, now)
         self.assertTrue(ok)
         self.assertIsNone(limit)
 
@@ -559,106 +949,117 @@ class TestHookEnforcement(TestCase):
 # ═══════════════════════════════════════════════════════════════════
 
 class TestWarnings(TestCase):
-    def setUp(self):
-        import balance_hook
-        self.tr = balance_hook
-
-    def test_window_closing_warning(self):
-        now = make_dt(hour=17, minute=50)  # 10 min before 18:00
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 100, 240)
-        self.assertTrue(any("Window closes" in w for w in warnings))
-
-    def test_window_warning_at_exact_threshold(self):
-        now = make_dt(hour=17, minute=45)  # exactly 15 min before 18:00
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 100, 240)
-        self.assertTrue(any("Window closes" in w for w in warnings))
-
-    def test_no_window_warning_when_far(self):
-        now = make_dt(hour=10, minute=0)
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 100, 240)
-        self.assertFalse(any("Window closes" in w for w in warnings))
-
-    def test_no_window_warning_one_minute_outside_threshold(self):
-        now = make_dt(hour=17, minute=44)  # 16 min before — just outside threshold
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 100, 240)
-        self.assertFalse(any("Window closes" in w for w in warnings))
-
-    def test_cap_approaching_warning(self):
-        now = make_dt(hour=10)
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 220, 240)  # 20 min left
-        self.assertTrue(any("Daily usage" in w for w in warnings))
-
-    def test_no_cap_warning_when_far(self):
-        now = make_dt(hour=10)
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 100, 240)
-        self.assertFalse(any("Daily usage" in w for w in warnings))
-
-    def test_both_warnings(self):
-        now = make_dt(hour=17, minute=50)  # Near window end AND near cap
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 230, 240)
-        self.assertEqual(len(warnings), 2)
-
-    def test_no_warning_when_active_end_none(self):
-        now = make_dt(hour=17, minute=50)
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, None, 100, 240)
-        self.assertFalse(any("Window closes" in w for w in warnings))
+    tr = balance_hook
+
+    # (hour, minute, active_end_m, used, limit, want_window, want_cap)
+    CASES = [
+        (17, 50, 1080, 100, 240, True, False),   # 10 min before 18:00
+        (17, 45, 1080, 100, 240, True, False),   # exactly 15 min before
+        (17, 44, 1080, 100, 240, False, False),  # 16 min before: just outside
+        (10, 0, 1080, 100, 240, False, False),   # far from both
+        (10, 0, 1080, 220, 240, False, True),    # 20 min of cap left
+        (17, 50, 1080, 230, 240, True, True),    # near window end and cap
+        (17, 50, None, 100, 240, False, False),  # no active window end
+    ]
+
+    def test_warning_table(self):
+        for hour, minute, end_m, used, limit, want_window, want_cap in self.CASES:
+            with self.subTest(time=f"{hour:02d}:{minute:02d}", end_m=end_m, used=used):
+                warnings = self.tr.build_warnings(MINI_CFG, hour * 60 + minute, end_m, used, limit)
+                self.assertEqual(any("Window closes" in w for w in warnings), want_window)
+                self.assertEqual(any("Daily usage" in w for w in warnings), want_cap)
+                self.assertEqual(len(warnings), want_window + want_cap)
+
+    def test_precomputed_thresholds_used(self):
+        config = {**MINI_CFG, "_warn_end": 5, "_warn_cap": 10}
+        self.assertEqual(self.tr.build_warnings(config, 1070, 1080, 220, 240), [])  # 10 and 20 left
+        self.assertEqual(len(self.tr.build_warnings(config, 1076, 1080, 232, 240)), 2)
 
     def test_warning_message_contains_minutes(self):
         now = make_dt(hour=17, minute=53)  # 7 min before close
-        warnings = self.tr.build_warnings(SAMPLE_CONFIG, now, 1080, 100, 240)
+        warnings = self.tr.build_warnings(MINI_CFG, minute_of(now), 1080, 100, 240)
         self.assertTrue(any("7 minutes" in w for w in warnings))
 
 
+class TestContextPayload(TestCase):
+    tr = balance_hook
+
+    def test_matches_json_dumps(self):
+        for msg in [
+            "Window closes in 5 minutes.",
+            "Daily usage: 220/240 min (20 min remaining). | Window closes in 5 minutes.",
+            "Time override active: Quick 15-min session \u2014 12m remaining",
+            'say "hi"',
+            "back\\slash",
+            "line\nbreak",
+        ]:
+            payload = self.tr._ctx(msg)
+            self.assertEqual(payload, json.dumps({"additionalContext": msg}))
+            self.assertEqual(json.loads(payload)["additionalContext"], msg)
+
+
 # ═══════════════════════════════════════════════════════════════════
 # Extension menu (block message)
 # ═══════════════════════════════════════════════════════════════════
 
-class TestExtensionMenu(TestCase):
-    def setUp(self):
-        import balance_hook
-        self.tr = balance_hook
-        self.tmpdir = Path(tempfile.mkdtemp())
-        self._orig_usage_dir = balance_utils.USAGE_DIR
-        balance_utils.USAGE_DIR = self.tmpdir
-
-    def tearDown(self):
-        balance_utils.USAGE_DIR = self._orig_usage_dir
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
+class TestExtensionMenu(UsageDirTestCase):
+    tr = balance_hook
 
     def test_shows_full_path_to_extend_cmd(self):
         """Block message must show full path so user can copy-paste from terminal."""
-        now = make_dt()
-        msg = self.tr.extension_menu(SAMPLE_CONFIG, now, "Blocked.")
-        self.assertIn("balance-extend", msg)
+        now = TUE_1000
+        msg = self.tr.extension_menu(PARSED_SAMPLE_CONFIG, now, "Blocked.")
         # Must be a full path, not a bare command
-        self.assertIn("/", msg.split("balance-extend")[0].split("\n")[-1])
+        self.assertTrue(os.path.isabs(balance_utils.EXTEND_CMD))
+        self.assertIn(balance_utils.EXTEND_CMD, msg)
 
     def test_shows_available_extensions(self):
-        now = make_dt()
-        msg = self.tr.extension_menu(SAMPLE_CONFIG, now, "Blocked.")
+        now = TUE_1000
+        msg = self.tr.extension_menu(PARSED_SAMPLE_CONFIG, now, "Blocked.")
         self.assertIn("quick", msg)
         self.assertIn("more", msg)
         self.assertIn("2 remaining", msg)
         self.assertIn("3 remaining", msg)
 
     def test_shows_run_from_terminal_label(self):
-        now = make_dt()
-        msg = self.tr.extension_menu(SAMPLE_CONFIG, now, "Blocked.")
+        now = TUE_1000
+        msg = self.tr.extension_menu(PARSED_SAMPLE_CONFIG, now, "Blocked.")
         self.assertIn("Run from terminal", msg)
 
     def test_context_string_included(self):
-        now = make_dt()
-        msg = self.tr.extension_menu(SAMPLE_CONFIG, now, "Outside hours.")
+        now = TUE_1000
+        msg = self.tr.extension_menu(PARSED_SAMPLE_CONFIG, now, "Outside hours.")
         self.assertTrue(msg.startswith("Outside hours."))
 
+    def test_precomputed_lines_match_on_the_fly(self):
+        now = TUE_1000
+        balance_utils.record_extension(now, "quick")
+        self.assertEqual(
+            self.tr.extension_menu(PARSED_SAMPLE_CONFIG, now, "Blocked."),
+            self.tr.extension_menu(SAMPLE_CONFIG, now, "Blocked."),
+        )
+
+    def test_extensions_added_after_load(self):
+        config = {**PARSED_SAMPLE_CONFIG, "extensions": {
+            **SAMPLE_CONFIG["extensions"],
+            "custom": {"minutes": 5, "max_per_day": 1, "label": "Custom"},
+        }}
+        msg = self.tr.extension_menu(config, TUE_1000, "Blocked.")
+        self.assertIn("Custom (1 remaining)", msg)
+        self.assertIn("Quick 15-min session (2 remaining)", msg)
+
+    def test_label_with_braces(self):
+        config = {**SAMPLE_CONFIG, "extensions": {"x": {"minutes": 5, "max_per_day": 1, "label": "{odd} label"}}}
+        msg = self.tr.extension_menu(config, TUE_1000, "Blocked.")
+        self.assertIn("{odd} label (1 remaining)", msg)
+
     def test_shows_none_left_when_exhausted(self):
-        now = make_dt()
-        for _ in range(2):
-            balance_utils.record_extension(now, "quick")
-        for _ in range(3):
-            balance_utils.record_extension(now, "more")
+        now = TUE_1000
+        # Seed the exhausted state directly: one .cnt file per type, count = size
+        (self.tmpdir / "2026-02-24.quick.cnt").write_bytes(b"xx")
+        (self.tmpdir / "2026-02-24.more.cnt").write_bytes(b"xxx")
 
-        msg = self.tr.extension_menu(SAMPLE_CONFIG, now, "Blocked.")
+        msg = self.tr.extension_menu(PARSED_SAMPLE_CONFIG, now, "Blocked.")
         self.assertIn("none left", msg)
         self.assertIn("No extensions remaining", msg)
 
@@ -667,27 +1068,36 @@ class TestExtensionMenu(TestCase):
 # Hook stdout flushing (regression: warnings were silently dropped)
 # ═══════════════════════════════════════════════════════════════════
 
-class TestHookOutput(TestCase):
-    """Integration tests against the hook process via stdin/stdout."""
+class TestHookOutput(UsageDirTestCase):
+    """Tests against the hook's main() via stdin/stdout/exit code.
+
+    main() runs in-process with patched stdio; set BALANCE_E2E=1 to also
+    spawn the real hook script once as an end-to-end smoke test.
+    """
+
+    tr = balance_hook
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._BASE_ENV = dict(os.environ)  # for the subprocess smoke test
 
     def _run_hook(self, prompt="test", env=None):
-        import subprocess
-        hook_path = REPO_ROOT / "balance_hook.py"
-        input_data = json.dumps({"prompt": prompt})
-        result = subprocess.run(
-            ["python3", str(hook_path)],
-            input=input_data,
-            capture_output=True,
-            text=True,
-            env={**os.environ, **(env or {})},
-        )
-        return result
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch.dict(os.environ, env or {}), \
+                patch("sys.stdin", io.StringIO(_dumps({"prompt": prompt}))), \
+                patch("sys.stdout", stdout), patch("sys.stderr", stderr):
+            try:
+                self.tr.main()
+                returncode = 0
+            except SystemExit as e:
+                returncode = e.code
+        return types.SimpleNamespace(returncode=returncode, stdout=stdout.getvalue(), stderr=stderr.getvalue())
 
     def test_override_active_outputs_context(self):
         """When override is active, hook must output additionalContext to stdout."""
-        from datetime import datetime, timedelta
         expires = datetime.now() + timedelta(minutes=30)
-        override_data = json.dumps({
+        override_data = _dumps({
             "type": "quick",
             "label": "Quick 15-min session",
             "expires_at": expires.isoformat(),
@@ -699,7 +1109,7 @@ class TestHookOutput(TestCase):
             result = self._run_hook(env={"BALANCE_OVERRIDE": "1"})
             self.assertEqual(result.returncode, 0)
             self.assertTrue(result.stdout.strip(), "Hook produced no stdout with active override")
-            data = json.loads(result.stdout.strip())
+            data = _loads(result.stdout.strip())
             self.assertIn("additionalContext", data)
         finally:
             override_path.unlink(missing_ok=True)
@@ -718,45 +1128,60 @@ class TestHookOutput(TestCase):
         result = self._run_hook(env={"BALANCE_OVERRIDE": "1"})
         self.assertEqual(result.returncode, 0)
 
+    @skipUnless(os.environ.get("BALANCE_E2E"), "set BALANCE_E2E=1 to spawn the real hook process")
+    def test_subprocess_smoke(self):
+        """The real script flushes additionalContext to stdout before exiting."""
+        result = subprocess.run(
+            [sys.executable, str(REPO_ROOT / "balance_hook.py")],
+            input=_dumps({"prompt": "test"}),
+            capture_output=True,
+            text=True,
+            env={**self._BASE_ENV, "BALANCE_OVERRIDE": "1"},
+        )
+        self.assertEqual(result.returncode, 0)
+        self.assertIn("additionalContext", _loads(result.stdout.strip()))
+
 
 # ═══════════════════════════════════════════════════════════════════
 # HAL mode (balance-extend CLI)
 # ═══════════════════════════════════════════════════════════════════
 
-class TestHalMode(TestCase):
-    def setUp(self):
-        self.tmpdir = Path(tempfile.mkdtemp())
-        self._orig_usage_dir = balance_utils.USAGE_DIR
-        balance_utils.USAGE_DIR = self.tmpdir
-
-        import importlib.util, types
-        cli_path = str(REPO_ROOT / "balance-extend")
-        loader = importlib.machinery.SourceFileLoader("balance_extend", cli_path)
-        self.cli = types.ModuleType(loader.name)
-        loader.exec_module(self.cli)
-
-    def tearDown(self):
-        balance_utils.USAGE_DIR = self._orig_usage_dir
-        shutil.rmtree(self.tmpdir, ignore_errors=True)
+class TestHalMode(UsageDirTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.cli = _load_cli()
 
     def test_total_extensions_counts_all_types(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.record_extension(now, "quick")
         balance_utils.record_extension(now, "more")
         balance_utils.record_extension(now, "more")
-        self.assertEqual(self.cli.total_extensions_today(SAMPLE_CONFIG, now), 3)
+        self.assertEqual(self.cli.total_extensions_today(PARSED_SAMPLE_CONFIG, now), 3)
+
+    def test_cmd_extend_scans_counts_once(self):
+        now = TUE_1000
+        config = {**PARSED_SAMPLE_CONFIG, "override": {"file": str(self.tmpdir / "override.json")}}
+        balance_utils.record_extension(now, "quick")
+        with patch.object(self.cli, "extension_counts_today", wraps=self.cli.extension_counts_today) as scan, \
+                patch.object(self.cli, "hal_mode", return_value=True) as hal, \
+                patch("sys.stdout", io.StringIO()):
+            self.cli.cmd_extend("more", config, now)
+        self.assertEqual(scan.call_count, 1)
+        self.assertEqual(hal.call_args.args[2], 1)  # total handed over, not recounted
+        self.assertEqual(balance_utils.count_extensions_today(now, "more"), 1)
 
     def test_no_hal_under_threshold(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.record_extension(now, "quick")
-        total = self.cli.total_extensions_today(SAMPLE_CONFIG, now)
+        total = self.cli.total_extensions_today(PARSED_SAMPLE_CONFIG, now)
         self.assertLess(total, 2)
 
     def test_hal_triggers_at_threshold(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.record_extension(now, "quick")
         balance_utils.record_extension(now, "more")
-        total = self.cli.total_extensions_today(SAMPLE_CONFIG, now)
+        total = self.cli.total_extensions_today(PARSED_SAMPLE_CONFIG, now)
         self.assertGreaterEqual(total, 2)
 
     def test_hal_stage_escalation(self):
@@ -766,37 +1191,41 @@ class TestHalMode(TestCase):
         self.assertEqual(min(10 - 2, len(self.cli.HAL_STAGES) - 1), 2)  # Caps at max
 
     def test_hal_correct_passphrase_returns_true(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.record_extension(now, "quick")
         balance_utils.record_extension(now, "more")
         with patch("builtins.input", return_value="i'm sorry hal"):
-            result = self.cli.hal_mode(SAMPLE_CONFIG, now)
+            result = self.cli.hal_mode(PARSED_SAMPLE_CONFIG, now)
         self.assertTrue(result)
 
     def test_hal_wrong_passphrase_returns_false(self):
-        now = make_dt()
+        now = TUE_1000
         balance_utils.record_extension(now, "quick")
         balance_utils.record_extension(now, "more")
         with patch("builtins.input", return_value="let me in"):
-            result = self.cli.hal_mode(SAMPLE_CONFIG, now)
+            result = self.cli.hal_mode(PARSED_SAMPLE_CONFIG, now)
         self.assertFalse(result)
 
     def test_hal_stage_1_passphrase(self):
-        now = make_dt()
+        now = TUE_1000
         for _ in range(3):
             balance_utils.record_extension(now, "quick")
         with patch("builtins.input", return_value="open the pod bay doors"):
-            result = self.cli.hal_mode(SAMPLE_CONFIG, now)
+            result = self.cli.hal_mode(PARSED_SAMPLE_CONFIG, now)
         self.assertTrue(result)
 
     def test_hal_stage_2_passphrase(self):
-        now = make_dt()
+        now = TUE_1000
         for _ in range(4):
             balance_utils.record_extension(now, "quick")
         with patch("builtins.input", return_value="my mind is going i can feel it"):
-            result = self.cli.hal_mode(SAMPLE_CONFIG, now)
+            result = self.cli.hal_mode(PARSED_SAMPLE_CONFIG, now)
         self.assertTrue(result)
 
 
 if __name__ == "__main__":
+    if importlib.util.find_spec("pytest") and importlib.util.find_spec("xdist"):
+        import pytest
+        # One worker per core; whole TestCase classes stay on one worker
+        sys.exit(pytest.main([__file__, "-n", "auto", "--dist=loadscope", "-p", "no:cacheprovider"]))
     unittest_main(verbosity=2)